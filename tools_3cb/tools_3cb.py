@@ -1,41 +1,331 @@
 import logging
+import os
+import threading
+from bisect import insort
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
+# Results of a deck along with the card bitmaps of each opponent and whether the
+# opponent contains banned cards, aligned with the rows of results
+CachedDeck = namedtuple("CachedDeck", ["results", "bitmaps", "banned"])
+
+
+def _popcount(bitmaps):
+    """Count the bits set in each bitmap (last axis) of an array of bitmaps"""
+    return np.bitwise_count(bitmaps).sum(axis=-1)
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _shared_cards(bitmap, query):
+        """Count the bits set in both bitmaps"""
+        count = 0
+        for word in range(len(bitmap)):
+            shared = bitmap[word] & query[word]
+            while shared:
+                shared &= shared - np.uint64(1)
+                count += 1
+        return count
+
+    @njit(cache=True, parallel=True)
+    def _guess_cells(bitmaps, results, starts, ends, queries, cell_decks, cell_opponents):
+        """
+        Compute Tools3CB.guess_result for each cell, given as a pair of deck slots.
+        The results of the deck in slot k are results[starts[k]:ends[k]], against the
+        opponents encoded in the same rows of bitmaps, and queries[k] is the bitmap of
+        the deck itself.
+        """
+        guesses = np.full(len(cell_decks), np.nan)
+        for cell in prange(len(cell_decks)):
+            deck = cell_decks[cell]
+            opponent = cell_opponents[cell]
+            total = 0.0
+            count = 0
+            for row in range(starts[deck], ends[deck]):
+                if _shared_cards(bitmaps[row], queries[opponent]) > 1:
+                    total += results[row]
+                    count += 1
+            # Reverse matchup
+            for row in range(starts[opponent], ends[opponent]):
+                if _shared_cards(bitmaps[row], queries[deck]) > 1:
+                    total -= results[row]
+                    count += 1
+            if count:
+                guesses[cell] = total / count
+        return guesses
+else:
+    _guess_cells = None
+
+
 class Tools3CB:
-    def __init__(self, banlist="banlist.txt", database="database"):
-        self.banlist = Path(banlist).read_text().splitlines()
+    def __init__(self, banlist="banlist.txt", database="database", storage="parquet"):
+        """
+        storage selects the database format: "parquet" keeps every matchup in a single
+        columnar file, "csv" reads and writes the legacy one-file-per-deck layout.
+        In CSV mode decks without a CSV file are read from the Parquet store if there
+        is one, and when both formats exist saving a deck updates both.
+        """
+        self.banlist = frozenset(Path(banlist).read_text().splitlines())
         self.database = database
         self.decklist = Path(f"{self.database}/decks.txt").read_text().splitlines()
+        self._decklist_set = set(self.decklist)
+        self._decks_dirty = False
+        # Saved results waiting to be written to the Parquet store by flush
+        self._pending = dict()
         self.cache = dict()
+        # Cards are numbered so that decks can be encoded as bitmaps of uint64 words.
+        # Repeated copies of a card get their own id, so that shared bits count
+        # shared cards as a multiset.
+        self._card_id = dict()
+        self._deck_ids = dict()
+        self._card_id_lock = threading.Lock()
+        self._decklist_bitmaps = self._bitmaps(
+            [self._card_ids(deck) for deck in self.decklist]
+        )
+        self._banlist_bitmap = self._bitmaps([self._banlist_ids()])[0]
+        # Negated results without banned opponents, keyed by deck and banlist
+        self._banhash = hash(self.banlist)
+        self._neg_cache = dict()
+        # Results of a deck with one row per card of each opponent
+        self._cards_cache = dict()
+        if storage not in ("parquet", "csv"):
+            raise ValueError(f"Unknown storage format {storage}")
+        self.storage = storage
+        self._store_path = f"{self.database}/matchups.parquet"
+        if self.storage == "parquet" or Path(self._store_path).exists():
+            self._all = self._load_store()
+        else:
+            self._all = None
+
+    def _load_store(self):
+        """
+        Load all the results in the database, building the Parquet store from the
+        per-deck CSV files if it doesn't exist yet
+        """
+        if Path(self._store_path).exists():
+            store = pd.read_parquet(self._store_path)
+        else:
+            logger.info(f"Building {self._store_path} from CSV files")
+            results = list()
+            for deck in self.decklist:
+                try:
+                    deck_db = self._read_csv(deck).reset_index()
+                except FileNotFoundError:
+                    continue
+                results.append(deck_db.assign(Decklist=deck))
+            columns = ["Decklist", "Opponent Decklist", "Result"]
+            store = pd.concat([pd.DataFrame(columns=columns), *results], ignore_index=True)
+            store = store[columns].astype({"Result": "float64"})
+            store.to_parquet(self._store_path, index=False)
+        store = store.set_index(["Decklist", "Opponent Decklist"])
+        return self._group_store(store)
+
+    @staticmethod
+    def _group_store(store):
+        """
+        Sort the store by deck, keeping the order of the opponents of each deck
+        """
+        decks = store.index.get_level_values("Decklist").to_numpy()
+        return store.iloc[np.argsort(decks, kind="stable")]
+
+    def _read_csv(self, deck):
+        """
+        Read the results of a deck from its CSV file.
+        Setting the TOOLS3CB_FAST_IO environment variable to 1 parses it with polars
+        if available, or with the pyarrow engine of pandas otherwise.
+        """
+        path = f"{self.database}/{deck}.csv"
+        if os.environ.get("TOOLS3CB_FAST_IO") != "1":
+            results = pd.read_csv(path, index_col=0)
+        elif pl is not None:
+            results = pl.read_csv(path, schema_overrides={"Result": pl.Float64}).to_pandas()
+            results = results.set_index(results.columns[0])
+        else:
+            results = pd.read_csv(
+                path, index_col=0, engine="pyarrow", dtype={"Result": "float64"}
+            )
+        return results.rename_axis("Opponent Decklist")
+
+    def _save_store(self):
+        """Merge the pending results into the Parquet store and write it"""
+        decks = list(self._pending)
+        new = pd.concat(
+            {deck: deck_db[["Result"]] for deck, deck_db in self._pending.items()},
+            names=["Decklist", "Opponent Decklist"],
+        )
+        others = self._all.drop(decks, level="Decklist", errors="ignore")
+        self._all = self._group_store(pd.concat([others, new.astype("float64")]))
+        self._all.reset_index().to_parquet(self._store_path, index=False)
+        if self.storage == "parquet":
+            # Keep the CSV files left from the legacy layout up to date
+            for deck, deck_db in self._pending.items():
+                if Path(f"{self.database}/{deck}.csv").exists():
+                    deck_db.to_csv(f"{self.database}/{deck}.csv")
+        self._pending = dict()
+
+    def export_csv(self):
+        """
+        Write the results of every deck in the database to its own CSV file, as in the
+        legacy layout
+        """
+        for deck in self.decklist:
+            self.load_deck(deck).to_csv(f"{self.database}/{deck}.csv")
 
     def load_deck(self, deck: str):
         """
         Load the results of a deck from the database
         """
+        return self._load_cached_deck(deck).results
+
+    def _load_cached_deck(self, deck):
+        """
+        Load the results of a deck from the database together with the split cards
+        of its opponents
+        """
         if deck in self.cache:
             return self.cache[deck]
 
-        try:
-            results = pd.read_csv(f"{self.database}/{deck}.csv", index_col=0)
-        except FileNotFoundError:
-            results = pd.DataFrame(columns=["Result"])
-        self.cache[deck] = results
-        return results
+        if self.storage == "csv":
+            try:
+                return self._cache_deck(deck, self._read_csv(deck))
+            except FileNotFoundError:
+                # Fall back to the Parquet store if there is one
+                if self._all is None and deck in self._decklist_set:
+                    raise
+        results = pd.DataFrame(columns=["Result"])
+        if self._all is not None:
+            try:
+                results = self._all.xs(deck, level="Decklist")
+            except KeyError:
+                pass
+        return self._cache_deck(deck, results)
+
+    def _cache_deck(self, deck, results):
+        """Encode the opponents of a deck as card bitmaps and cache them"""
+        bitmaps = self._bitmaps([self._card_ids(opp) for opp in results.index])
+        banned = self._banned_mask(bitmaps)
+        self.cache[deck] = CachedDeck(results, bitmaps, banned)
+        return self.cache[deck]
+
+    def _card_ids(self, deck):
+        """Return the ids of the cards in a deck, assigning new ids to unseen cards"""
+        if deck not in self._deck_ids:
+            ids = list()
+            copies = Counter()
+            # Decks can be loaded from several threads in CSV mode, see self._map_decks
+            with self._card_id_lock:
+                for card in deck.split(' | '):
+                    key = (card, copies[card])
+                    copies[card] += 1
+                    if key not in self._card_id:
+                        self._card_id[key] = len(self._card_id)
+                    ids.append(self._card_id[key])
+            self._deck_ids[deck] = ids
+        return self._deck_ids[deck]
+
+    def _banlist_ids(self):
+        """Return the ids of the banned cards"""
+        ids = list()
+        with self._card_id_lock:
+            for card in self.banlist:
+                if (card, 0) not in self._card_id:
+                    self._card_id[(card, 0)] = len(self._card_id)
+                ids.append(self._card_id[(card, 0)])
+        return ids
+
+    def _map_decks(self, func, decks):
+        """
+        Apply func to each deck, returning the results in the order of decks.
+        With CSV storage every deck is read from its own file, so the decks are
+        processed in a thread pool to overlap the reads.
+        """
+        if self.storage != "csv":
+            return [func(deck) for deck in decks]
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            return list(executor.map(func, decks))
+
+    def _bitmaps(self, card_ids):
+        """
+        Encode lists of card ids as rows of bitmaps, wide enough for all the ids
+        assigned so far
+        """
+        words = len(self._card_id) // 64 + 1
+        bitmaps = np.zeros((len(card_ids), words), dtype=np.uint64)
+        rows = np.repeat(np.arange(len(card_ids)), [len(ids) for ids in card_ids])
+        ids = np.fromiter(
+            (i for deck_ids in card_ids for i in deck_ids), dtype=np.uint64, count=len(rows)
+        )
+        bits = np.left_shift(np.uint64(1), ids % np.uint64(64))
+        np.bitwise_or.at(bitmaps, (rows, (ids // np.uint64(64)).astype(np.intp)), bits)
+        return bitmaps
+
+    def _banned_mask(self, bitmaps):
+        """Return whether each bitmap contains any banned card"""
+        # Bitmaps encoded at different times can have different widths, but ids
+        # beyond the width of a bitmap are never set in it
+        words = min(bitmaps.shape[-1], len(self._banlist_bitmap))
+        banned = bitmaps[..., :words] & self._banlist_bitmap[:words]
+        return banned.any(axis=-1)
 
     def save_deck(self, deck_db, deck):
         """
-        Save the results of a deck to the database
+        Save the results of a deck to the database.
+        The Parquet store and decks.txt are only written by self.flush, which must be
+        called after saving to persist the changes.
         """
-        deck_db.to_csv(f"{self.database}/{deck}.csv")
+        if self.storage == "csv":
+            deck_db.to_csv(f"{self.database}/{deck}.csv")
+        if self._all is not None:
+            self._pending[deck] = deck_db
+        self._cache_deck(deck, deck_db)
+        self._neg_cache = {
+            key: value for key, value in self._neg_cache.items() if key[0] != deck
+        }
+        self._cards_cache.pop(deck, None)
         # Add deck to decklist keeping it sorted and unique
-        self.decklist.append(deck)
-        self.decklist = sorted(set(self.decklist))
-        Path(f"{self.database}/decks.txt").write_text("\n".join(self.decklist))
+        if deck not in self._decklist_set:
+            self._decklist_set.add(deck)
+            insort(self.decklist, deck)
+            self._decks_dirty = True
+            self._decklist_bitmaps = None
+
+    def flush(self):
+        """
+        Write the results saved with self.save_deck and the decklist to the database
+        """
+        if self._pending:
+            self._save_store()
+        if self._decks_dirty:
+            Path(f"{self.database}/decks.txt").write_text("\n".join(self.decklist))
+            self._decks_dirty = False
+
+    def _discard_pending(self):
+        """Forget the results saved and the decks added since the last self.flush"""
+        self._pending = dict()
+        self.cache = dict()
+        self._neg_cache = dict()
+        self._cards_cache = dict()
+        self.decklist = Path(f"{self.database}/decks.txt").read_text().splitlines()
+        self._decklist_set = set(self.decklist)
+        self._decks_dirty = False
+        self._decklist_bitmaps = None
 
     @staticmethod
     def load_gauntlet(self, path="gauntlet.txt"):
@@ -47,70 +337,128 @@ class Tools3CB:
         results)
         """
         logging.info(f"Ingesting {xlsx_path}")
-        df = pd.read_excel(xlsx_path)
+        columns = ["Decklist", "Opponent Decklist", "Result"]
+        # Read only relevant columns, whose names can have extra spaces
+        usecols = lambda column: column.strip() in columns
+        try:
+            df = pd.read_excel(xlsx_path, engine="calamine", usecols=usecols)
+        except ImportError:
+            df = pd.read_excel(
+                xlsx_path,
+                engine="openpyxl",
+                engine_kwargs={"read_only": True},
+                usecols=usecols,
+            )
         # Fix extra spaces in column names
         df.columns = df.columns.str.strip()
-        # Keep only relevant columns
-        df = df[["Decklist", "Opponent Decklist", "Result"]]
+        df = df[columns]
         # Convert results to numbers
-        pd.set_option('future.no_silent_downcasting', True)
-        df = df.replace({"Result": {"Win": 1, "Tie": 0, "Loss": -1}})
+        results = df["Result"].map({"Win": 1, "Tie": 0, "Loss": -1})
+        unknown = df["Result"].notna() & results.isna()
+        if unknown.any():
+            raise ValueError(f"Unknown result {df['Result'][unknown].iloc[0]}")
+        df["Result"] = results
         # Fill in values for second match of each game
         df = df.ffill()
         # Average results of same decks
-        df = df.groupby(["Decklist", "Opponent Decklist"]).mean()
+        grouped = df.groupby(["Decklist", "Opponent Decklist"], sort=False, observed=True)
+        averages = grouped["Result"].mean()
 
         # Process decklists
-        for deck in df.index.levels[0]:
-            try:
+        try:
+            for deck, new_results in averages.groupby(level=0, sort=False):
                 # Load existing results
                 deck_db = self.load_deck(deck)
-            except FileNotFoundError:
-                # Create new results
-                deck_db = pd.DataFrame(columns=["Opponent Decklist", "Result"])
-                deck_db = deck_db.set_index("Opponent Decklist")
-
-            # Update results
-            for opponent in df.loc[deck].index:
-                new_result = df.loc[deck, opponent]["Result"]
-                if opponent in deck_db.index:
-                    old_result = deck_db.loc[opponent, "Result"]
-                    if new_result != old_result:
-                        raise ValueError(
-                            f"Conflicting results for {deck} vs {opponent}"
-                        )
-                else:
-                    deck_db.loc[opponent, "Result"] = new_result
-            # Save results
-            self.save_deck(deck_db, deck)
-
-    def remove_banlist(self, deck_db):
-        """Remove decks that contain banned cards from the index of a table"""
-        for deck in deck_db.index:
-            cards = deck.split(' | ')
-            if any(card in self.banlist for card in cards):
-                deck_db = deck_db.drop(deck)
-        return deck_db
+                new_results = new_results.droplevel(0)
+
+                # Update results, keeping the existing opponents in their order and
+                # adding new opponents at the end in sorted order
+                added = new_results.index.difference(deck_db.index).sort_values()
+                index = deck_db.index.append(added)
+                old_results = deck_db["Result"].astype("float64").reindex(index)
+                new_results = new_results.reindex(index)
+                conflicts = (
+                    old_results.notna()
+                    & new_results.notna()
+                    & (old_results != new_results)
+                )
+                if conflicts.any():
+                    opponent = index[conflicts].min()
+                    raise ValueError(f"Conflicting results for {deck} vs {opponent}")
+                deck_db = old_results.fillna(new_results)
+                deck_db = deck_db.to_frame("Result").rename_axis("Opponent Decklist")
+                # Save results
+                self.save_deck(deck_db, deck)
+        except Exception:
+            if self.storage == "parquet":
+                # Don't let a later flush write the results merged before the failure
+                self._discard_pending()
+            else:
+                # The CSV files of the decks saved so far are already written
+                self.flush()
+            raise
+        self.flush()
+
+    def _neg_filtered(self, deck):
+        """
+        Return the negated results of a deck (i.e. the results of its opponents
+        against it) without opponents containing banned cards
+        """
+        key = (deck, self._banhash)
+        if key not in self._neg_cache:
+            cached = self._load_cached_deck(deck)
+            self._neg_cache[key] = self.remove_banlist(-cached.results, cached.banned)
+        return self._neg_cache[key]
+
+    def _load_cards(self, deck):
+        """
+        Return the results of a deck with one row for each card of each opponent,
+        flagging the rows of opponents containing banned cards
+        """
+        if deck not in self._cards_cache:
+            cached = self._load_cached_deck(deck)
+            cards_db = cached.results.assign(
+                cards=[opp.split(' | ') for opp in cached.results.index],
+                Banned=cached.banned,
+            )
+            self._cards_cache[deck] = cards_db.explode("cards")
+        return self._cards_cache[deck]
+
+    def remove_banlist(self, deck_db, banned=None):
+        """
+        Remove decks that contain banned cards from the index of a table.
+        banned can be a precomputed boolean mask of the banned rows of the table.
+        """
+        if banned is None:
+            bitmaps = self._bitmaps([self._card_ids(deck) for deck in deck_db.index])
+            banned = self._banned_mask(bitmaps)
+        return deck_db[~banned]
     
     def get_deck_global_score(self, deck, use_banlist=True):
         """
         Returns the global score of a deck, i.e. the total score against all other decks
         """
-        deck_db = self.load_deck(deck)
+        cached = self._load_cached_deck(deck)
+        results = cached.results["Result"].to_numpy(dtype="float64")
         if use_banlist:
-            deck_db = self.remove_banlist(deck_db)
-        return deck_db["Result"].sum()
+            results = results[~cached.banned]
+        return np.nansum(results)
     
     def get_all_global_scores(self, use_banlist=True):
         """
         Returns a DataFrame with the global scores of all decks
         """
-        decks = list()
-        scores = list()
-        for deck in self.decklist:
-            if not use_banlist or not any(card in self.banlist for card in deck.split(' | ')):
-                decks.append(deck)
-                scores.append(self.get_deck_global_score(deck, use_banlist))
+        decks = self.decklist
+        if use_banlist:
+            if self._decklist_bitmaps is None:
+                self._decklist_bitmaps = self._bitmaps(
+                    [self._card_ids(deck) for deck in self.decklist]
+                )
+            banned = self._banned_mask(self._decklist_bitmaps)
+            decks = [deck for deck, is_banned in zip(decks, banned) if not is_banned]
+        scores = self._map_decks(
+            lambda deck: self.get_deck_global_score(deck, use_banlist), decks
+        )
         table = pd.DataFrame(scores, index=decks)
         table = table.sort_values(by=0, ascending=False)
         table.columns = ["Global score"]
@@ -122,28 +470,28 @@ class Tools3CB:
         Returns a DataFrame with all decks that have a known score above the threshold
         against the gauntlet
         """
-        table = pd.DataFrame()
-        for deck in gauntlet:
-            if deck not in self.decklist:
+        def load_column(deck):
+            if deck not in self._decklist_set:
                 logger.warning(f"Deck {deck} not found in database")
-                table[deck] = pd.Series(dtype="float")
-                continue
+                return pd.Series(dtype="float", name=deck)
             # Negate values as we are loading the reverse results
-            deck_db = -self.load_deck(deck)
-            deck_db = self.remove_banlist(deck_db)
-            deck_db = deck_db.rename(columns={"Result": deck})
-            table = pd.concat([table, deck_db], axis=1)
+            deck_db = self._neg_filtered(deck)
+            return deck_db["Result"].rename(deck)
+
+        columns = self._map_decks(load_column, gauntlet)
+        table = pd.concat(columns, axis=1) if columns else pd.DataFrame()
         result = table.copy()
         result.insert(0, "Known score", table.sum(axis=1))
         sort_columns = ["Known score"]
         if threshold is not None:
             result = result[result["Known score"] > threshold]
         if estimate:
-            est = self.fill_guesses(table)
+            # Only guess the missing results of the decks that passed the threshold
+            est = self.fill_guesses(table.loc[result.index])
             result.insert(1, "Estimated score", est.sum(axis=1))
             sort_columns.append("Estimated score")
 
-        global_scores = [self.get_deck_global_score(deck) for deck in result.index] 
+        global_scores = [self.get_deck_global_score(deck) for deck in result.index]
         result.insert(2, "Global score", global_scores)
         sort_columns.append("Global score")
         result = result.sort_values(by=sort_columns, ascending=False, kind="stable")
@@ -157,21 +505,19 @@ class Tools3CB:
         The score of a card against a deck is the average score of all decks including
         that card against the deck.
         """
-        table = pd.DataFrame()
-        for deck in gauntlet:
-            if deck not in self.decklist:
+        def load_column(deck):
+            if deck not in self._decklist_set:
                 logger.warning(f"Deck {deck} not found in database")
-                table[deck] = pd.Series(dtype="float")
-                continue
-            # Negate values as we are loading the reverse results
-            deck_db = -self.load_deck(deck)
+                return pd.Series(dtype="float", name=deck)
+            cards_db = self._load_cards(deck)
             if remove_banlist:
-                deck_db = self.remove_banlist(deck_db)
-            # deck_db.index is a series of opponent decks. Split each on ' | ' to obtain a list of cards
-            cards_db = deck_db.assign(cards=deck_db.index.str.split(' | ', regex=False))
-            cards_db = cards_db.explode("cards").groupby("cards").mean()
-            cards_db = cards_db.rename(columns={"Result": deck})
-            table = pd.concat([table, cards_db], axis=1)
+                cards_db = cards_db[~cards_db["Banned"]]
+            # Negate values as we are loading the reverse results
+            cards_db = -cards_db.groupby("cards")["Result"].mean()
+            return cards_db.rename(deck)
+
+        columns = self._map_decks(load_column, gauntlet)
+        table = pd.concat(columns, axis=1) if columns else pd.DataFrame()
         table.insert(0, "Total", table.sum(axis=1))
         if threshold is not None:
             table = table[table["Total"] > threshold]
@@ -184,42 +530,86 @@ class Tools3CB:
         Return a guess for the result of the given deck against the given opponent.
         Averages the results from self.get_guesses, also considering the reverse matchup.
         """
-        guesses = self.get_guesses(deck, opponent) + [
-            -guess for guess in self.get_guesses(opponent, deck)
-        ]
-        if not guesses:
+        forward, backward = self._get_guesses_arrays(deck, opponent)
+        guesses = np.concatenate((forward, -backward))
+        if not len(guesses):
             return None
-        return sum(guesses) / len(guesses)
+        return guesses.mean()
+
+    def _get_guesses_arrays(self, deck, opponent):
+        """
+        Return the results of self.get_guesses for the matchup and for the reverse
+        matchup as arrays
+        """
+        return self._similar_results(deck, opponent), self._similar_results(opponent, deck)
 
     def get_guesses(self, deck, opponent):
         """
         Return a list of results for the given deck against any opponent sharing
         more than one card with the given opponent.
         """
+        return self._similar_results(deck, opponent).tolist()
+
+    def _similar_results(self, deck, opponent):
+        """Return the array of results for self.get_guesses"""
         # TODO: Implement a better guess
-        deck_db = self.load_deck(deck)
-        opponent_cards = opponent.split(' | ')
-        guesses = list()
-        for opp in deck_db.index:
-            opp_cards = opp.split(' | ')
-            similarity = 0
-            for card in opponent_cards:
-                if card in opp_cards:
-                    opp_cards.remove(card)
-                    similarity += 1
-            if similarity>1:
-                guess = deck_db.loc[opp, "Result"]
-                guesses.append(guess)
+        cached = self._load_cached_deck(deck)
+        opponent_bitmap = self._bitmaps([self._card_ids(opponent)])[0]
+        words = min(cached.bitmaps.shape[1], len(opponent_bitmap))
+        similarity = _popcount(cached.bitmaps[:, :words] & opponent_bitmap[:words])
+        results = cached.results["Result"].to_numpy(dtype="float64")
+        return results[similarity>1]
+
+    def _guess_matrix(self, decks, opponents, mask):
+        """
+        Return an array of guesses for each deck (rows) against each opponent
+        (columns), computed only where mask is True and NaN elsewhere.
+        """
+        guesses = np.full(mask.shape, np.nan)
+        cells = np.argwhere(mask)
+        if _guess_cells is None:
+            for i, j in cells:
+                guess = self.guess_result(decks[i], opponents[j])
+                if guess is not None:
+                    guesses[i, j] = guess
+            return guesses
+
+        # Pack the results and opponent bitmaps of every deck involved in a cell
+        names = list(dict.fromkeys(
+            [*decks[np.unique(cells[:, 0])], *opponents[np.unique(cells[:, 1])]]
+        ))
+        slots = {name: slot for slot, name in enumerate(names)}
+        cached = [self._load_cached_deck(name) for name in names]
+        # Encoded last so that queries are as wide as every cached bitmap
+        queries = self._bitmaps([self._card_ids(name) for name in names])
+        ends = np.cumsum([len(deck.results) for deck in cached])
+        starts = ends - [len(deck.results) for deck in cached]
+        bitmaps = np.zeros((ends[-1] if len(ends) else 0, queries.shape[1]), dtype=np.uint64)
+        results = np.empty(len(bitmaps))
+        for deck, start, end in zip(cached, starts, ends):
+            bitmaps[start:end, :deck.bitmaps.shape[1]] = deck.bitmaps
+            results[start:end] = deck.results["Result"].to_numpy(dtype="float64")
+
+        cell_decks = np.array([slots[deck] for deck in decks[cells[:, 0]]], dtype=np.intp)
+        cell_opponents = np.array(
+            [slots[opponent] for opponent in opponents[cells[:, 1]]], dtype=np.intp
+        )
+        guesses[mask] = _guess_cells(
+            bitmaps, results, starts, ends, queries, cell_decks, cell_opponents
+        )
         return guesses
 
     def fill_guesses(self, table):
         """
         Fill in the missing values in the table with guesses based on self.guess_result.
         """
-        for deck in table.index:
-            for opponent in table.columns:
-                if pd.isna(table.loc[deck, opponent]):
-                    table.loc[deck, opponent] = self.guess_result(deck, opponent)
+        values = table.to_numpy(dtype="float64", copy=True)
+        mask = np.isnan(values)
+        decks = table.index.to_numpy()
+        opponents = table.columns.to_numpy()
+        guesses = self._guess_matrix(decks, opponents, mask)
+        values[mask] = guesses[mask]
+        table[:] = values
         return table
 
 